@@ -1,11 +1,20 @@
 import os
 import sys
+import time
 import logging
+import threading
 from pathlib import Path
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 
-from core import load_config, save_config, check_api
+from core import (load_config, save_config, check_api, load_snapshot, save_snapshot, CheckRunner, EndpointRegistry,
+                  NotificationPipeline, STATUS_UP, STATUS_DOWN)
+
+# How often state is snapshotted for warm starts (it is also saved on quit)
+SNAPSHOT_INTERVAL_MS = 5 * 60 * 1000
+# A snapshot older than this many check intervals is too old to show as the
+# last known status or to compare the first check against
+SNAPSHOT_MAX_AGE_INTERVALS = 3
 
 
 class SettingsDialog(QtWidgets.QDialog):
@@ -42,6 +51,98 @@ class SettingsDialog(QtWidgets.QDialog):
         return {'api_url': self.api_url_edit.text(), 'api_key': self.api_key_edit.text()}
 
 
+class LoadTestDialog(QtWidgets.QDialog):
+    """Runs loadtest.run_load_test against the configured endpoint in a background thread."""
+
+    result_ready = QtCore.pyqtSignal(object)
+
+    def __init__(self, parent=None, config=None):
+        super().__init__(parent)
+        self.setWindowTitle('Load Test')
+        self.config = config or {}
+        self._stop = threading.Event()
+        self.rate_spin = QtWidgets.QDoubleSpinBox()
+        self.rate_spin.setRange(0, 10000)
+        self.rate_spin.setValue(10)
+        self.rate_spin.setSpecialValueText('Closed-loop')
+        self.concurrency_spin = QtWidgets.QSpinBox()
+        self.concurrency_spin.setRange(1, 1000)
+        self.concurrency_spin.setValue(10)
+        self.duration_spin = QtWidgets.QSpinBox()
+        self.duration_spin.setRange(1, 3600)
+        self.duration_spin.setValue(10)
+        self.steps_spin = QtWidgets.QSpinBox()
+        self.steps_spin.setRange(1, 50)
+        self.steps_spin.setValue(1)
+
+        form = QtWidgets.QFormLayout()
+        form.addRow('Target rate (req/s):', self.rate_spin)
+        form.addRow('Concurrency:', self.concurrency_spin)
+        form.addRow('Duration (s):', self.duration_spin)
+        form.addRow('Ramp steps:', self.steps_spin)
+
+        self.report_view = QtWidgets.QPlainTextEdit()
+        self.report_view.setReadOnly(True)
+        self.btn_start = QtWidgets.QPushButton('Start')
+        self.btn_stop = QtWidgets.QPushButton('Stop')
+        self.btn_stop.setEnabled(False)
+        btns = QtWidgets.QHBoxLayout()
+        btns.addStretch(1)
+        btns.addWidget(self.btn_start)
+        btns.addWidget(self.btn_stop)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addLayout(form)
+        layout.addLayout(btns)
+        layout.addWidget(self.report_view, 1)
+        self.resize(520, 420)
+
+        self.btn_start.clicked.connect(self.start)
+        self.btn_stop.clicked.connect(self._stop.set)
+        self.result_ready.connect(self._on_finished)
+
+    def start(self):
+        from loadtest import run_load_test
+        if not self.config.get('api_url'):
+            self.report_view.setPlainText('Set an API URL first.')
+            return
+        self._stop.clear()
+        self.btn_start.setEnabled(False)
+        self.btn_stop.setEnabled(True)
+        self.report_view.setPlainText('Running…')
+        rate = self.rate_spin.value() or None
+        kwargs = dict(rate=rate, concurrency=self.concurrency_spin.value(),
+                      duration=float(self.duration_spin.value()), steps=self.steps_spin.value(),
+                      stop=self._stop)
+
+        def run():
+            try:
+                result = run_load_test(self.config.get('api_url'), self.config.get('api_key'), **kwargs)
+            except Exception as e:
+                result = e
+            self.result_ready.emit(result)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _on_finished(self, result):
+        from loadtest import save_results, format_report
+        self.btn_start.setEnabled(True)
+        self.btn_stop.setEnabled(False)
+        if isinstance(result, Exception):
+            self.report_view.setPlainText(f'Load test failed: {result}')
+            return
+        try:
+            path = save_results(result)
+        except OSError as e:
+            self.report_view.setPlainText(f'{format_report(result)}\n\nCould not save results: {e}')
+            return
+        self.report_view.setPlainText(f'{format_report(result)}\n\nResults saved to {path}')
+
+    def closeEvent(self, event):
+        self._stop.set()
+        super().closeEvent(event)
+
+
 def _setup_logging():
     log = logging.getLogger('apitray')
     if log.handlers:
@@ -65,7 +166,19 @@ def _setup_logging():
     return log
 
 
+def _format_age(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return 'just now'
+    if minutes < 60:
+        return f'{minutes} min ago'
+    return f'{minutes // 60} h ago'
+
+
 class TrayApp(QtWidgets.QSystemTrayIcon):
+    # Emitted from a CheckRunner worker thread; delivered on the GUI thread
+    check_finished = QtCore.pyqtSignal(int, bool, object, object, float)
+
     def __init__(self, app):
         super().__init__()
         self.app = app
@@ -74,10 +187,55 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
         # Backfill defaults for newly added settings
         self.config.setdefault('interval_seconds', 60)
         self.config.setdefault('notify_mode', 'all')
-        # Initial neutral icon before first check
-        self.setIcon(self._create_icon('gray', label='…'))
-        self.setToolTip('API Status Checker')
-        self.last_ok = None
+        self._icon_cache = {}
+        self._current_icon_key = None
+        self.first_status_at = None
+        # Per-endpoint check state, restored from the last snapshot when there is one;
+        # the tray currently watches a single endpoint
+        self.registry = EndpointRegistry()
+        self.stats = {'checks': 0, 'ok': 0, 'latency_ewma': None}
+        snapshot_age = None
+        snapshot = load_snapshot()
+        if snapshot is not None:
+            self.registry, aggregates, saved_at = snapshot
+            snapshot_age = time.time() - saved_at
+            # Only take known counters, and None only where the default is None
+            self.stats.update((k, v) for k, v in aggregates.items()
+                              if k in self.stats and (v is not None or self.stats[k] is None))
+        url = self.config.get('api_url') or None
+        eid = self.registry.find(url) if url else None
+        max_age = SNAPSHOT_MAX_AGE_INTERVALS * int(self.config.get('interval_seconds', 60))
+        if snapshot_age is not None and not 0 <= snapshot_age <= max_age:
+            # Too old to trust: start the endpoint over as unknown so the first
+            # check is not reported as a change from long-gone state
+            eid = None
+        for stale_id in self.registry.ids():
+            # Drop state for URLs that are no longer watched
+            if stale_id != eid:
+                self.registry.remove(stale_id)
+        self.endpoint_id = eid if eid is not None else self.registry.add(url)
+        if self.last_ok is None:
+            # Initial neutral icon before first check
+            self.setIcon(self._create_icon('gray', label='…'))
+            self.setToolTip('API Status Checker')
+        else:
+            # Last known status, muted until a fresh check comes back
+            ok = self.last_ok
+            self._set_status_icon('#8fbc8f' if ok else '#d08080', '✓' if ok else '!')
+            age = _format_age(snapshot_age)
+            self.setToolTip(f'API status: {"OK" if ok else "DOWN"} (last known {age}, checking…)')
+        # Checks run off the GUI thread and are dropped if the config changes meanwhile
+        self.runner = CheckRunner()
+        self.check_finished.connect(self._on_check_finished)
+        self.app.aboutToQuit.connect(self.shutdown)
+        # Transitions are queued and turned into batched, rate-limited notifications
+        self.notifications = NotificationPipeline()
+        self.notify_timer = QtCore.QTimer()
+        self.notify_timer.setSingleShot(True)
+        self.notify_timer.timeout.connect(self._flush_notifications)
+        self.snapshot_timer = QtCore.QTimer()
+        self.snapshot_timer.timeout.connect(self.save_state)
+        self.snapshot_timer.start(SNAPSHOT_INTERVAL_MS)
         self.log.info('App started. Config loaded (url=%s, interval=%ss, notify=%s).',
                       ('set' if self.config.get('api_url') else 'missing'),
                       self.config.get('interval_seconds', 60),
@@ -124,6 +282,7 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
         settings_action.triggered.connect(self.show_settings)
         menu.addSeparator()
         quit_action = menu.addAction('Quit')
+        # shutdown() runs once, via aboutToQuit
         quit_action.triggered.connect(QtWidgets.qApp.quit)
         self.setContextMenu(menu)
 
@@ -145,6 +304,23 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
         except Exception:
             pass
 
+    @property
+    def last_ok(self):
+        status = self.registry.status(self.endpoint_id)
+        return True if status == STATUS_UP else False if status == STATUS_DOWN else None
+
+    def _set_status_icon(self, color: str, label: str):
+        # Only repaint when the status actually changes
+        key = (color, label)
+        if self._current_icon_key == key:
+            return
+        if key not in self._icon_cache:
+            self._icon_cache[key] = self._create_icon(color, label=label)
+        self._current_icon_key = key
+        self.setIcon(self._icon_cache[key])
+        if self.first_status_at is None:
+            self.first_status_at = time.perf_counter()
+
     def _create_icon(self, color: str, label: str = '') -> QtGui.QIcon:
         # Draw a larger pixmap for crispness on HiDPI and scale down
         size = 64
@@ -182,9 +358,8 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
             # keep existing interval if not managed by dialog
             self.config.setdefault('interval_seconds', load_config().get('interval_seconds', 60))
             self.config.setdefault('notify_mode', load_config().get('notify_mode', 'all'))
-            save_config(self.config)
             self.update_timer()
-            self.update_status()
+            self._config_changed()
 
     def show_first_run(self):
         # Try to bring our app and dialog to front on macOS LSUIElement
@@ -204,9 +379,8 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
             self.config = dialog.get_values()
             self.config.setdefault('interval_seconds', load_config().get('interval_seconds', 60))
             self.config.setdefault('notify_mode', load_config().get('notify_mode', 'all'))
-            save_config(self.config)
             self.update_timer()
-            self.update_status()
+            self._config_changed()
 
     # --- App window (Dock-visible) ---
     def open_main_window(self):
@@ -226,17 +400,18 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
         self._main_window.activateWindow()
 
     def update_status(self):
-        ok = False
-        status_code = None
-        err = None
-        try:
-            from core import check_api_details
-            ok, status_code, err = check_api_details(self.config.get('api_url'), self.config.get('api_key'))
-        except Exception as e:
-            err = str(e)
+        # A check for the current config is already running; its result will do
+        if self.runner.busy():
+            return
+        self.runner.submit(self.config.get('api_url'), self.config.get('api_key'), self.check_finished.emit)
+
+    def _on_check_finished(self, generation: int, ok: bool, status_code, err, latency: float):
+        if generation != self.runner.generation:
+            self.log.info('Dropped result from stale config generation %s', generation)
+            return
         color = 'green' if ok else 'red'
         label = '✓' if ok else '!'
-        self.setIcon(self._create_icon(color, label=label))
+        self._set_status_icon(color, label)
         interval = int(self.config.get('interval_seconds', 60))
         self.setToolTip(f'API status: {"OK" if ok else "DOWN"} • every {interval}s')
         # Log result
@@ -248,15 +423,51 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
                 self.log.warning('Check DOWN (url=%s, error=%s)', url_state, err)
             else:
                 self.log.warning('Check DOWN (url=%s, status=%s)', url_state, status_code)
-        # Notifications according to mode
+        # Queue transitions (not the first result); _flush_notifications shows them
+        if self.last_ok is not None and self.last_ok != ok:
+            self.notifications.push(self.endpoint_id, ok)
+            # Restart even if a later retry is scheduled; due_in() is the earliest deadline
+            self.notify_timer.start(int(self.notifications.due_in() * 1000))
+        self.registry.set_key(self.endpoint_id, self.config.get('api_url') or None)
+        self.registry.record(self.endpoint_id, ok, latency)
+        self.registry.schedule(self.endpoint_id, time.time() + interval)
+        self.stats['checks'] += 1
+        self.stats['ok'] += int(ok)
+        prev = self.stats['latency_ewma']
+        self.stats['latency_ewma'] = latency if prev is None else 0.8 * prev + 0.2 * latency
+        if getattr(self, '_main_window', None) is not None:
+            self._main_window.show_result(ok, status_code, err)
+
+    def _flush_notifications(self):
         mode = self.config.get('notify_mode', 'all')
-        # Notify on transition to DOWN
-        if self.last_ok is True and not ok and mode in ('all', 'fail'):
-            self.showMessage('API Down', 'The API did not respond successfully.', QtWidgets.QSystemTrayIcon.Critical, 5000)
-        # Notify on recovery
-        if self.last_ok is False and ok and mode == 'all':
-            self.showMessage('API Recovered', 'The API is responding again.', QtWidgets.QSystemTrayIcon.Information, 4000)
-        self.last_ok = ok
+        for n in self.notifications.flush(mode):
+            if n.ok:
+                self.showMessage(n.title, n.message, QtWidgets.QSystemTrayIcon.Information, 4000)
+            else:
+                self.showMessage(n.title, n.message, QtWidgets.QSystemTrayIcon.Critical, 5000)
+        if self.notifications.deferred:
+            self.log.info('Holding back %s status change(s) (cooldown, flapping or rate limit)',
+                          self.notifications.deferred)
+        due = self.notifications.due_in()
+        if due is not None:
+            self.notify_timer.start(int(due * 1000))
+
+    def _config_changed(self):
+        # Results still in flight describe the old config; drop them and recheck
+        save_config(self.config)
+        self.runner.invalidate()
+        self.update_status()
+
+    def save_state(self):
+        try:
+            save_snapshot(self.registry, self.stats)
+        except OSError as e:
+            self.log.warning('Could not save state snapshot: %s', e)
+
+    def shutdown(self):
+        if not self.runner.shutdown(timeout=1.0):
+            self.log.warning('Check threads still running at shutdown')
+        self.save_state()
 
     def update_timer(self):
         interval_ms = max(5, int(self.config.get('interval_seconds', 60))) * 1000
@@ -267,24 +478,22 @@ class TrayApp(QtWidgets.QSystemTrayIcon):
         text, ok = QtWidgets.QInputDialog.getText(None, 'Set API URL', 'Enter API URL:', QtWidgets.QLineEdit.Normal, current)
         if ok and text:
             self.config['api_url'] = text.strip()
-            save_config(self.config)
-            self.update_status()
+            self._config_changed()
 
     def set_api_key(self):
         current = self.config.get('api_key', '')
         text, ok = QtWidgets.QInputDialog.getText(None, 'Set API Key', 'Enter API Key:', QtWidgets.QLineEdit.Password, current)
         if ok:
             self.config['api_key'] = text
-            save_config(self.config)
-            self.update_status()
+            self._config_changed()
 
     def set_interval(self):
         current = int(self.config.get('interval_seconds', 60))
         value, ok = QtWidgets.QInputDialog.getInt(None, 'Set Interval', 'Seconds between checks:', current, 5, 86400, 1)
         if ok:
             self.config['interval_seconds'] = int(value)
-            save_config(self.config)
             self.update_timer()
+            self._config_changed()
 
     def set_notify_mode(self, mode: str):
         self.config['notify_mode'] = mode
@@ -310,11 +519,13 @@ class MainWindow(QtWidgets.QMainWindow):
         # Controls
         self.btn_check = QtWidgets.QPushButton('Check Now')
         self.btn_settings = QtWidgets.QPushButton('Open Settings…')
+        self.btn_load_test = QtWidgets.QPushButton('Load Test…')
         self.btn_open_config = QtWidgets.QPushButton('Reveal Config File')
         self.btn_open_logs = QtWidgets.QPushButton('Reveal Log File')
         ctrl_layout = QtWidgets.QHBoxLayout()
         ctrl_layout.addWidget(self.btn_check)
         ctrl_layout.addWidget(self.btn_settings)
+        ctrl_layout.addWidget(self.btn_load_test)
         ctrl_layout.addStretch(1)
         ctrl_layout.addWidget(self.btn_open_config)
         ctrl_layout.addWidget(self.btn_open_logs)
@@ -341,6 +552,7 @@ class MainWindow(QtWidgets.QMainWindow):
         # Signals
         self.btn_check.clicked.connect(self._check_now)
         self.btn_settings.clicked.connect(self.tray.show_settings)
+        self.btn_load_test.clicked.connect(self._open_load_test)
         self.btn_open_config.clicked.connect(self._reveal_config)
         self.btn_open_logs.clicked.connect(self._reveal_logs)
 
@@ -360,17 +572,23 @@ class MainWindow(QtWidgets.QMainWindow):
         self.log_view.append(line)
 
     def _check_now(self):
-        from core import check_api_details
-        cfg = self.tray.config
-        ok, status, err = check_api_details(cfg.get('api_url'), cfg.get('api_key'))
+        # The tray runs the check in the background and calls show_result
+        self.tray.update_status()
+
+    def show_result(self, ok, status, err):
         if ok:
             self.status_label.setText(f'Status: OK ({status})')
             self._append_log(f'Check OK (status={status})')
         else:
             self.status_label.setText('Status: DOWN')
             self._append_log(f'Check DOWN (status={status}, err={err})')
-        # Also update tray icon + internal state
-        self.tray.update_status()
+
+    def _open_load_test(self):
+        if not hasattr(self, '_load_test_dialog') or self._load_test_dialog is None:
+            self._load_test_dialog = LoadTestDialog(self, config=self.tray.config)
+        self._load_test_dialog.config = self.tray.config
+        self._load_test_dialog.show()
+        self._load_test_dialog.raise_()
 
     def _reveal_config(self):
         from core import CONFIG_PATH
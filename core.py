@@ -1,11 +1,25 @@
+import base64
 import json
+import os
+import socket
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from itertools import compress
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, NamedTuple, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
 
 
 CONFIG_PATH = Path.home() / '.api_tray_config.json'
+SNAPSHOT_PATH = Path.home() / '.api_tray_state.json'
+SNAPSHOT_VERSION = 1
 
 
 def load_config() -> Dict[str, object]:
@@ -20,16 +34,18 @@ def save_config(config: Dict[str, object]) -> None:
         json.dump(config, f)
 
 
-def check_api_details(api_url: str, api_key: str):
+def check_api_details(api_url: str, api_key: str, session=None, timeout: float = 5):
     """Return (ok: bool, status: int|None, error: str|None).
 
-    Makes a GET request to api_url with optional Bearer api_key.
+    Makes a GET request to api_url with optional Bearer api_key. Pass a
+    requests.Session to reuse pooled connections across calls.
     """
     if not api_url:
         return False, None, None
     try:
         headers = {'Authorization': f'Bearer {api_key}'} if api_key else {}
-        response = requests.get(api_url, headers=headers, timeout=5)
+        get = session.get if session is not None else requests.get
+        response = get(api_url, headers=headers, timeout=timeout)
         return bool(response.ok), int(getattr(response, 'status_code', 0) or 0), None
     except requests.RequestException as e:
         return False, None, str(e)
@@ -38,3 +54,556 @@ def check_api_details(api_url: str, api_key: str):
 def check_api(api_url: str, api_key: str) -> bool:
     ok, _status, _err = check_api_details(api_url, api_key)
     return ok
+
+
+def save_snapshot(registry: 'EndpointRegistry', aggregates: Optional[Dict[str, object]] = None,
+                  path: Optional[Path] = None) -> None:
+    """Write registry state and aggregates atomically so a crash never leaves half a file."""
+    path = Path(path) if path else SNAPSHOT_PATH
+    data = {
+        'version': SNAPSHOT_VERSION,
+        'saved_at': time.time(),
+        'registry': registry.to_snapshot(),
+        'aggregates': aggregates or {},
+    }
+    tmp = path.with_name(path.name + '.tmp')
+    with tmp.open('w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def load_snapshot(path: Optional[Path] = None):
+    """Return (registry, aggregates, saved_at), or None if there is no usable snapshot."""
+    path = Path(path) if path else SNAPSHOT_PATH
+    try:
+        with path.open('r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION:
+            return None
+        aggregates, saved_at = data.get('aggregates', {}), data['saved_at']
+        # Aggregates are counters and averages; anything else means the file was tampered with
+        if not isinstance(aggregates, dict) or not all(v is None or _is_number(v) for v in aggregates.values()):
+            return None
+        if not _is_number(saved_at):
+            return None
+        return EndpointRegistry.from_snapshot(data['registry']), aggregates, saved_at
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _connect_tracked(conn, on_socket) -> socket.socket:
+    """Open conn's socket like urllib3's create_connection, but report it before connect().
+
+    Reporting first means a connect stalled on an unreachable host can be
+    aborted by shutting the socket down from another thread. urllib3 has no
+    public hook for that, so this mirrors create_connection from urllib3 1.26
+    and 2.x (the range pinned in requirements.txt) and is installed by
+    _TrackingAdapter in place of HTTPConnection._new_conn.
+    """
+    host = conn.host.strip('[]')
+    err = None
+    try:
+        for af, socktype, proto, _name, sa in socket.getaddrinfo(host, conn.port, allowed_gai_family(),
+                                                                 socket.SOCK_STREAM):
+            sock = socket.socket(af, socktype, proto)
+            on_socket(sock)
+            try:
+                for opt in conn.socket_options or ():
+                    sock.setsockopt(*opt)
+                if isinstance(conn.timeout, (int, float)):
+                    sock.settimeout(conn.timeout)
+                if conn.source_address:
+                    sock.bind(conn.source_address)
+                sock.connect(sa)
+                return sock
+            except OSError as e:
+                err = e
+                sock.close()
+        raise err or OSError('getaddrinfo returns an empty list')
+    except socket.timeout as e:
+        raise ConnectTimeoutError(conn, f'Connection to {conn.host} timed out. (connect timeout={conn.timeout})') from e
+    except OSError as e:
+        raise NewConnectionError(conn, f'Failed to establish a new connection: {e}') from e
+
+
+def _track_pools(manager, on_socket) -> None:
+    """Make manager's connection pools open their sockets through _connect_tracked."""
+    if getattr(manager, '_tracked', False):
+        return
+    classes = {}
+    for scheme, pool_cls in manager.pool_classes_by_scheme.items():
+        class Connection(pool_cls.ConnectionCls):
+            def _new_conn(self):
+                return _connect_tracked(self, on_socket)
+        classes[scheme] = type(pool_cls.__name__, (pool_cls,), {'ConnectionCls': Connection})
+    manager.pool_classes_by_scheme = classes
+    manager._tracked = True
+
+
+class _TrackingAdapter(HTTPAdapter):
+    """HTTPAdapter that reports every socket it opens to on_socket, proxied or not."""
+
+    def __init__(self, on_socket, **kwargs):
+        self._on_socket = on_socket
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        _track_pools(self.poolmanager, self._on_socket)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        # SOCKS pools open their sockets through PySocks; leave those untracked
+        if not proxy.lower().startswith('socks'):
+            _track_pools(manager, self._on_socket)
+        return manager
+
+
+class _InflightCheck:
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.thread: Optional[threading.Thread] = None
+        # (socket, dup) pairs; see _abort_socket
+        self.sockets: List[tuple] = []
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        for sock, dup in self.sockets:
+            _abort_socket(sock, dup)
+
+    def release(self) -> None:
+        for _sock, dup in self.sockets:
+            dup.close()
+        self.sockets.clear()
+
+
+def _abort_socket(sock: socket.socket, dup: socket.socket) -> None:
+    # shutdown() wakes a connect(), TLS handshake or recv() blocked in another
+    # thread; close() alone does not. It goes through dup, a second fd for the
+    # same socket, because wrapping sock for TLS detaches sock's own fd. A
+    # socket that has not started connecting yet rejects shutdown(), so close
+    # it to make its connect() fail instead.
+    try:
+        dup.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        sock.close()
+
+
+class CheckRunner:
+    """Runs check_api_details on background threads, tagged with a generation.
+
+    invalidate() bumps the generation and aborts in-flight checks by shutting
+    down their sockets; results from an older generation are never passed to
+    the callback. shutdown() does the same and waits a bounded time for the
+    worker threads to exit.
+    """
+
+    def __init__(self, timeout: float = 5):
+        self.timeout = timeout
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._inflight: List[_InflightCheck] = []
+        self._closed = False
+
+    def submit(self, api_url: str, api_key: str, callback) -> Optional[int]:
+        """Start a check; callback(generation, ok, status, err, latency) runs on the worker thread."""
+        check = _InflightCheck(self.generation)
+        session = requests.Session()
+        adapter = _TrackingAdapter(lambda sock: self._track(check, sock))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        check.thread = threading.Thread(target=self._run, args=(check, session, api_url, api_key, callback),
+                                        daemon=True)
+        with self._lock:
+            if self._closed:
+                session.close()
+                return None
+            check.generation = self.generation
+            self._inflight.append(check)
+            check.thread.start()
+        return check.generation
+
+    def _track(self, check: _InflightCheck, sock: socket.socket) -> None:
+        dup = sock.dup()
+        with self._lock:
+            check.sockets.append((sock, dup))
+            cancelled = check.cancelled
+        if cancelled:
+            _abort_socket(sock, dup)
+
+    def _run(self, check, session, api_url, api_key, callback) -> None:
+        started = time.monotonic()
+        try:
+            ok, status, err = check_api_details(api_url, api_key, session=session, timeout=self.timeout)
+        except Exception as e:
+            ok, status, err = False, None, str(e)
+        finally:
+            session.close()
+        latency = time.monotonic() - started
+        with self._lock:
+            self._inflight.remove(check)
+            check.release()
+            current = not check.cancelled and check.generation == self.generation
+        if current:
+            callback(check.generation, ok, status, err, latency)
+
+    def busy(self) -> bool:
+        with self._lock:
+            return any(c.generation == self.generation for c in self._inflight)
+
+    def invalidate(self) -> int:
+        """Drop all in-flight checks and return the new generation."""
+        with self._lock:
+            self.generation += 1
+            for check in self._inflight:
+                check.cancel()
+            return self.generation
+
+    def shutdown(self, timeout: float = 1.0) -> bool:
+        """Abort in-flight checks; return True if all workers exited within timeout."""
+        with self._lock:
+            self._closed = True
+            self.generation += 1
+            inflight = list(self._inflight)
+            for check in inflight:
+                check.cancel()
+        deadline = time.monotonic() + timeout
+        for check in inflight:
+            check.thread.join(max(0.0, deadline - time.monotonic()))
+        return not any(c.thread.is_alive() for c in inflight)
+
+
+# Endpoint status codes stored in EndpointRegistry. Free slots use _SLOT_FREE.
+STATUS_UNKNOWN = 1
+STATUS_DOWN = 2
+STATUS_UP = 3
+_SLOT_FREE = 0
+# bytes.translate tables mapping one status code to 1 and everything else to 0
+_STATUS_MASKS = {code: bytes(int(i == code) for i in range(256))
+                 for code in (_SLOT_FREE, STATUS_UNKNOWN, STATUS_DOWN, STATUS_UP)}
+
+
+class EndpointRegistry:
+    """Per-endpoint check state kept in parallel typed arrays.
+
+    Each endpoint is an integer id indexing into the arrays; removed ids are
+    reused by later adds, and find() looks ids up by key through a dict.
+    Status lives in a bytearray so that status queries such as down_ids()
+    scan in C rather than in Python. due_ids() is a plain linear scan.
+    """
+
+    def __init__(self):
+        self._status = bytearray()
+        self._latency = array('f')      # seconds of the last check
+        self._next_due = array('d')     # time.time() of the next check
+        self._failures = array('I')     # consecutive failed checks
+        self._last_change = array('d')  # time.time() of the last status change
+        self._keys: List[Optional[str]] = []
+        self._ids_by_key: Dict[str, int] = {}
+        self._free = array('l')
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, eid: int) -> bool:
+        return 0 <= eid < len(self._status) and self._status[eid] != _SLOT_FREE
+
+    def add(self, key: Optional[str] = None, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        if self._free:
+            eid = self._free.pop()
+            self._status[eid] = STATUS_UNKNOWN
+            self._latency[eid] = 0.0
+            self._next_due[eid] = now
+            self._failures[eid] = 0
+            self._last_change[eid] = now
+            self._keys[eid] = key
+        else:
+            eid = len(self._status)
+            self._status.append(STATUS_UNKNOWN)
+            self._latency.append(0.0)
+            self._next_due.append(now)
+            self._failures.append(0)
+            self._last_change.append(now)
+            self._keys.append(key)
+        if key is not None:
+            self._ids_by_key[key] = eid
+        self._count += 1
+        return eid
+
+    def _unindex(self, eid: int) -> None:
+        key = self._keys[eid]
+        if key is not None and self._ids_by_key.get(key) == eid:
+            del self._ids_by_key[key]
+
+    def remove(self, eid: int) -> None:
+        self._check(eid)
+        self._unindex(eid)
+        self._status[eid] = _SLOT_FREE
+        self._keys[eid] = None
+        self._free.append(eid)
+        self._count -= 1
+
+    def _check(self, eid: int) -> None:
+        if eid not in self:
+            raise KeyError(eid)
+
+    def record(self, eid: int, ok: bool, latency: float, now: Optional[float] = None) -> bool:
+        """Store a check result; return True if the status changed."""
+        self._check(eid)
+        now = time.time() if now is None else now
+        new = STATUS_UP if ok else STATUS_DOWN
+        changed = self._status[eid] != new
+        if changed:
+            self._status[eid] = new
+            self._last_change[eid] = now
+        self._latency[eid] = latency
+        self._failures[eid] = 0 if ok else self._failures[eid] + 1
+        return changed
+
+    def schedule(self, eid: int, due: float) -> None:
+        self._check(eid)
+        self._next_due[eid] = due
+
+    def set_key(self, eid: int, key: Optional[str]) -> None:
+        self._check(eid)
+        self._unindex(eid)
+        self._keys[eid] = key
+        if key is not None:
+            self._ids_by_key[key] = eid
+
+    def key(self, eid: int) -> Optional[str]:
+        self._check(eid)
+        return self._keys[eid]
+
+    def status(self, eid: int) -> int:
+        self._check(eid)
+        return self._status[eid]
+
+    def latency(self, eid: int) -> float:
+        self._check(eid)
+        return self._latency[eid]
+
+    def next_due(self, eid: int) -> float:
+        self._check(eid)
+        return self._next_due[eid]
+
+    def failures(self, eid: int) -> int:
+        self._check(eid)
+        return self._failures[eid]
+
+    def last_change(self, eid: int) -> float:
+        self._check(eid)
+        return self._last_change[eid]
+
+    def ids(self) -> List[int]:
+        return [eid for eid, st in enumerate(self._status) if st != _SLOT_FREE]
+
+    def ids_with_status(self, status: int) -> List[int]:
+        # Few matches: hop between them with find(). Many (e.g. an outage):
+        # find() per match costs more than one pass over a translated mask.
+        if self._status.count(status) <= len(self._status) // 8:
+            out = []
+            find = self._status.find
+            i = find(status)
+            while i != -1:
+                out.append(i)
+                i = find(status, i + 1)
+            return out
+        mask = self._status.translate(_STATUS_MASKS[status])
+        return list(compress(range(len(mask)), mask))
+
+    def down_ids(self) -> List[int]:
+        return self.ids_with_status(STATUS_DOWN)
+
+    def up_ids(self) -> List[int]:
+        return self.ids_with_status(STATUS_UP)
+
+    def due_ids(self, now: Optional[float] = None) -> List[int]:
+        now = time.time() if now is None else now
+        status = self._status
+        return [eid for eid, due in enumerate(self._next_due) if due <= now and status[eid] != _SLOT_FREE]
+
+    def to_snapshot(self) -> Dict[str, object]:
+        """Return the registry as a JSON-serializable dict; ids are preserved."""
+        def pack(a):
+            return base64.b64encode(a.tobytes() if isinstance(a, array) else bytes(a)).decode('ascii')
+        return {
+            'keys': list(self._keys),
+            'status': pack(self._status),
+            'latency': pack(self._latency),
+            'next_due': pack(self._next_due),
+            'failures': pack(self._failures),
+            'last_change': pack(self._last_change),
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: Dict[str, object]) -> 'EndpointRegistry':
+        reg = cls()
+        reg._status = bytearray(base64.b64decode(data['status']))
+        for name in ('latency', 'next_due', 'failures', 'last_change'):
+            getattr(reg, '_' + name).frombytes(base64.b64decode(data[name]))
+        reg._keys = list(data['keys'])
+        n = len(reg._status)
+        if not all(len(a) == n for a in (reg._latency, reg._next_due, reg._failures, reg._last_change, reg._keys)):
+            raise ValueError('snapshot arrays differ in length')
+        reg._free = array('l', (eid for eid in range(n - 1, -1, -1) if reg._status[eid] == _SLOT_FREE))
+        reg._count = n - len(reg._free)
+        reg._ids_by_key = {k: eid for eid, k in enumerate(reg._keys)
+                           if k is not None and reg._status[eid] != _SLOT_FREE}
+        return reg
+
+    def find(self, key: str) -> Optional[int]:
+        return self._ids_by_key.get(key)
+
+    def nbytes(self) -> int:
+        """Memory held by the registry itself, excluding the key strings."""
+        return sum(sys.getsizeof(a) for a in (self._status, self._latency, self._next_due, self._failures,
+                                              self._last_change, self._keys, self._ids_by_key, self._free))
+
+
+class Notification(NamedTuple):
+    title: str
+    message: str
+    ok: bool
+    keys: List[object]
+
+
+class NotificationPipeline:
+    """Turns up/down transitions into a few batched notifications.
+
+    push() only appends to a queue, so it is cheap to call from the check
+    callback. flush() drains the queue once the oldest event is window
+    seconds old and returns at most one DOWN and one RECOVERED summary.
+
+    Only a change from the last state notified for an endpoint is reported.
+    A change is held back, not dropped, while the endpoint is flapping
+    (flap_threshold transitions within flap_window), within cooldown of the
+    last notification of the same state, or while more than rate_limit
+    notifications went out in the last rate_period. It is re-checked once
+    the block expires (see due_in()), so the current state is always
+    reported in the end.
+    """
+
+    def __init__(self, window: float = 2.0, cooldown: float = 300.0, rate_limit: int = 4,
+                 rate_period: float = 60.0, flap_threshold: int = 4, flap_window: float = 600.0,
+                 clock=time.monotonic):
+        self.window = window
+        self.cooldown = cooldown
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.flap_threshold = flap_threshold
+        self.flap_window = flap_window
+        self.clock = clock
+        self._queue = deque()
+        self._current: Dict[object, bool] = {}
+        self._notified: Dict[object, bool] = {}
+        self._deferred: Dict[object, float] = {}  # key -> time its block expires
+        self._transitions: Dict[object, deque] = {}
+        self._last_sent: Dict[tuple, float] = {}
+        self._sent = deque()
+
+    def push(self, key, ok: bool, now: Optional[float] = None) -> None:
+        self._queue.append((self.clock() if now is None else now, key, ok))
+
+    def pending(self) -> bool:
+        return bool(self._queue or self._deferred)
+
+    @property
+    def deferred(self) -> int:
+        """Number of endpoints whose latest change is being held back."""
+        return len(self._deferred)
+
+    def due_in(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until flush() has something to do, or None if nothing is pending."""
+        times = list(self._deferred.values())
+        if self._queue:
+            times.append(self._queue[0][0] + self.window)
+        if not times:
+            return None
+        now = self.clock() if now is None else now
+        return max(0.0, min(times) - now)
+
+    def _flap_until(self, key, now: float) -> Optional[float]:
+        """Time the endpoint stops counting as flapping, or None if it is not."""
+        history = self._transitions.get(key)
+        if history is None:
+            return None
+        while history and history[0] <= now - self.flap_window:
+            history.popleft()
+        if len(history) < self.flap_threshold:
+            return None
+        return history[-self.flap_threshold] + self.flap_window
+
+    def flush(self, mode: str = 'all', now: Optional[float] = None) -> List[Notification]:
+        now = self.clock() if now is None else now
+        if self._queue and now - self._queue[0][0] >= self.window:
+            while self._queue:
+                ts, key, ok = self._queue.popleft()
+                self._transitions.setdefault(key, deque()).append(ts)
+                # Every push is a transition, so before the first one the
+                # endpoint was (and was last reported as) the opposite state
+                self._notified.setdefault(key, not ok)
+                self._current[key] = ok
+                self._deferred[key] = now
+        down, up = [], []
+        for key, retry_at in list(self._deferred.items()):
+            if retry_at > now:
+                continue
+            ok = self._current[key]
+            if ok == self._notified[key]:
+                # Back where it was last reported, e.g. a bounce inside one window
+                del self._deferred[key]
+                continue
+            if (not ok and mode not in ('all', 'fail')) or (ok and mode != 'all'):
+                # Not wanted in this mode; take it as the known state silently
+                self._notified[key] = ok
+                del self._deferred[key]
+                continue
+            blocked_until = self._flap_until(key, now)
+            last = self._last_sent.get((key, ok))
+            if last is not None and now - last < self.cooldown:
+                blocked_until = max(blocked_until or 0.0, last + self.cooldown)
+            if blocked_until is not None:
+                self._deferred[key] = blocked_until
+                continue
+            (up if ok else down).append(key)
+        out = []
+        for ok, keys in ((False, down), (True, up)):
+            if not keys:
+                continue
+            while self._sent and self._sent[0] <= now - self.rate_period:
+                self._sent.popleft()
+            if len(self._sent) >= self.rate_limit:
+                for key in keys:
+                    self._deferred[key] = self._sent[0] + self.rate_period
+                continue
+            self._sent.append(now)
+            for key in keys:
+                self._notified[key] = ok
+                self._last_sent[(key, ok)] = now
+                del self._deferred[key]
+            out.append(_summarize_transitions(ok, keys))
+        return out
+
+    def forget(self, key) -> None:
+        for state in (self._current, self._notified, self._deferred, self._transitions):
+            state.pop(key, None)
+        self._last_sent.pop((key, True), None)
+        self._last_sent.pop((key, False), None)
+
+
+def _summarize_transitions(ok: bool, keys: List[object]) -> Notification:
+    if len(keys) == 1:
+        if ok:
+            return Notification('API Recovered', 'The API is responding again.', True, keys)
+        return Notification('API Down', 'The API did not respond successfully.', False, keys)
+    if ok:
+        return Notification('APIs Recovered', f'{len(keys)} endpoints recovered', True, keys)
+    return Notification('APIs Down', f'{len(keys)} endpoints down', False, keys)
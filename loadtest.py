@@ -0,0 +1,305 @@
+"""Rate-controlled load test against the endpoint the tray watches.
+
+Reuses core.check_api_details with pooled connections. In rate mode requests
+are scheduled open-loop: each request has an intended start time fixed in
+advance, and latency is measured from that time, so a slow server cannot
+delay its own measurements (coordinated omission).
+
+Run from a terminal:
+
+    python loadtest.py --rate 50 --duration 10 --out results.json
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from core import load_config, check_api_details
+
+
+RESULTS_PATH = Path.home() / 'api_tray_loadtest.json'
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open.
+HISTOGRAM_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+# A step is saturated when it achieves less than this share of its target
+# rate, or when more than SATURATION_ERROR_RATIO of its requests fail.
+SATURATION_RPS_RATIO = 0.9
+SATURATION_ERROR_RATIO = 0.05
+
+
+class _Recorder:
+    """Thread-safe sink for per-request samples."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies_ms: List[float] = []
+        self.errors: Dict[str, int] = {}
+        self.ok = 0
+
+    def record(self, latency_ms: float, ok: bool, status, err) -> None:
+        with self._lock:
+            self.latencies_ms.append(latency_ms)
+            if ok:
+                self.ok += 1
+            else:
+                key = err[:120] if err else f'HTTP {status}'
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+
+class _SessionPool:
+    """One pooled requests.Session per worker thread."""
+
+    def __init__(self, pool_size: int):
+        self._local = threading.local()
+        self._pool_size = pool_size
+        self._lock = threading.Lock()
+        self._sessions: List[requests.Session] = []
+
+    def get(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions.clear()
+
+
+def _percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return round(sorted_values[idx], 3)
+
+
+def _histogram(latencies_ms: List[float]) -> List[Dict[str, object]]:
+    counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+    for value in latencies_ms:
+        for i, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    buckets = []
+    for i, count in enumerate(counts):
+        le = HISTOGRAM_BOUNDS_MS[i] if i < len(HISTOGRAM_BOUNDS_MS) else None
+        buckets.append({'le_ms': le, 'count': count})
+    return buckets
+
+
+def _summarize(recorder: _Recorder, elapsed: float, target_rps: Optional[float]) -> Dict[str, object]:
+    latencies = sorted(recorder.latencies_ms)
+    total = len(latencies)
+    failed = total - recorder.ok
+    return {
+        'target_rps': target_rps,
+        'requests': total,
+        'ok': recorder.ok,
+        'failed': failed,
+        'error_ratio': round(failed / total, 4) if total else 0.0,
+        'elapsed_seconds': round(elapsed, 3),
+        'achieved_rps': round(total / elapsed, 3) if elapsed > 0 else 0.0,
+        'latency_ms': {
+            'p50': _percentile(latencies, 50),
+            'p90': _percentile(latencies, 90),
+            'p99': _percentile(latencies, 99),
+            'max': round(latencies[-1], 3) if latencies else None,
+        },
+        'histogram': _histogram(latencies),
+        'errors': dict(sorted(recorder.errors.items(), key=lambda kv: -kv[1])),
+    }
+
+
+def _is_saturated(step: Dict[str, object]) -> bool:
+    target = step.get('target_rps')
+    if target and step['achieved_rps'] < SATURATION_RPS_RATIO * target:
+        return True
+    return step['error_ratio'] > SATURATION_ERROR_RATIO
+
+
+def _run_open_loop(api_url, api_key, rate, duration, pool, executor, timeout, stop):
+    recorder = _Recorder()
+
+    def fire(intended: float) -> None:
+        if stop.is_set():
+            return
+        ok, status, err = check_api_details(api_url, api_key, session=pool.get(), timeout=timeout)
+        # Measure from the intended start, not the actual one, so queueing
+        # behind a stalled server shows up as latency.
+        recorder.record((time.perf_counter() - intended) * 1000.0, ok, status, err)
+
+    futures = []
+    start = time.perf_counter()
+    # Always send at least one request, even when rate * duration < 1
+    total = max(1, int(rate * duration))
+    for i in range(total):
+        if stop.is_set():
+            break
+        intended = start + i / rate
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            stop.wait(delay)
+        futures.append(executor.submit(fire, intended))
+    for f in futures:
+        f.result()
+    # The schedule spans total / rate seconds even if the last request returns early
+    elapsed = time.perf_counter() - start
+    if not stop.is_set():
+        elapsed = max(elapsed, total / rate)
+    return recorder, elapsed, rate
+
+
+def _run_closed_loop(api_url, api_key, concurrency, duration, pool, executor, timeout, stop):
+    recorder = _Recorder()
+    deadline = time.perf_counter() + duration
+
+    def worker() -> None:
+        session = pool.get()
+        while not stop.is_set() and time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            ok, status, err = check_api_details(api_url, api_key, session=session, timeout=timeout)
+            recorder.record((time.perf_counter() - t0) * 1000.0, ok, status, err)
+
+    start = time.perf_counter()
+    futures = [executor.submit(worker) for _ in range(concurrency)]
+    for f in futures:
+        f.result()
+    return recorder, time.perf_counter() - start, None
+
+
+def run_load_test(api_url: str, api_key: str = '', rate: Optional[float] = None, concurrency: int = 10,
+                  duration: float = 10.0, steps: int = 1, timeout: float = 5.0,
+                  stop: Optional[threading.Event] = None) -> Dict[str, object]:
+    """Drive requests at api_url and return a JSON-serializable report.
+
+    With rate set, runs open-loop at that many requests per second, using up
+    to concurrency in-flight requests. With steps > 1 the rate ramps linearly
+    over the duration and the first step that falls short of its target (or
+    errors) is reported as the saturation point. Without rate, runs closed-loop
+    with concurrency workers issuing back-to-back requests.
+    """
+    if not api_url:
+        raise ValueError('api_url is required')
+    if rate is not None and rate <= 0:
+        raise ValueError('rate must be positive')
+    concurrency = max(1, int(concurrency))
+    steps = max(1, int(steps))
+    stop = stop or threading.Event()
+    pool = _SessionPool(concurrency)
+    started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    runs = []  # (recorder, elapsed, target_rps) per step
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            if rate is None:
+                runs.append(_run_closed_loop(api_url, api_key, concurrency, duration,
+                                             pool, executor, timeout, stop))
+            else:
+                for k in range(1, steps + 1):
+                    if stop.is_set():
+                        break
+                    step_rate = rate * k / steps
+                    runs.append(_run_open_loop(api_url, api_key, step_rate, duration / steps,
+                                               pool, executor, timeout, stop))
+    finally:
+        pool.close()
+
+    step_results = [_summarize(*run) for run in runs]
+    # A step stopped before it sent anything says nothing about saturation
+    saturated = next((s for s in step_results if s['requests'] and _is_saturated(s)), None)
+    # Percentiles are taken over every sample of the run, not merged per step
+    overall = _summarize(_merge_recorders([r for r, _e, _t in runs]), sum(e for _r, e, _t in runs),
+                         runs[-1][2] if runs else rate)
+    return {
+        'url': api_url,
+        'mode': 'closed-loop' if rate is None else 'open-loop',
+        'target_rps': rate,
+        'concurrency': concurrency,
+        'duration_seconds': duration,
+        'started_at': started_at,
+        'saturated': saturated is not None,
+        'saturation_rps': (saturated['target_rps'] or saturated['achieved_rps']) if saturated else None,
+        'summary': overall,
+        'steps': step_results,
+    }
+
+
+def _merge_recorders(recorders: List[_Recorder]) -> _Recorder:
+    merged = _Recorder()
+    for r in recorders:
+        merged.latencies_ms.extend(r.latencies_ms)
+        merged.ok += r.ok
+        for key, count in r.errors.items():
+            merged.errors[key] = merged.errors.get(key, 0) + count
+    return merged
+
+
+def save_results(results: Dict[str, object], path: Optional[Path] = None) -> Path:
+    path = Path(path) if path else RESULTS_PATH
+    with path.open('w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def format_report(results: Dict[str, object]) -> str:
+    s = results['summary']
+    lat = s['latency_ms']
+    lines = [
+        f"{results['mode']} against {results['url']}",
+        f"requests={s['requests']} ok={s['ok']} failed={s['failed']} achieved_rps={s['achieved_rps']}",
+        f"latency ms: p50={lat['p50']} p90={lat['p90']} p99={lat['p99']} max={lat['max']}",
+    ]
+    for b in s['histogram']:
+        if b['count']:
+            label = f"<= {b['le_ms']} ms" if b['le_ms'] is not None else f"> {HISTOGRAM_BOUNDS_MS[-1]} ms"
+            lines.append(f"  {label:>12}: {b['count']}")
+    for key, count in s['errors'].items():
+        lines.append(f"  error {key}: {count}")
+    if results['saturated']:
+        lines.append(f"saturated at {results['saturation_rps']} rps")
+    return '\n'.join(lines)
+
+
+def main(argv=None) -> int:
+    cfg = load_config()
+    parser = argparse.ArgumentParser(description='Load test the API Test Tray endpoint.')
+    parser.add_argument('--url', default=cfg.get('api_url', ''), help='endpoint (default: configured api_url)')
+    parser.add_argument('--key', default=cfg.get('api_key', ''), help='bearer token (default: configured api_key)')
+    parser.add_argument('--rate', type=float, default=None, help='target requests/second (open-loop)')
+    parser.add_argument('--concurrency', type=int, default=10, help='max in-flight requests')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run')
+    parser.add_argument('--steps', type=int, default=1, help='ramp the rate over this many steps')
+    parser.add_argument('--timeout', type=float, default=5.0, help='per-request timeout in seconds')
+    parser.add_argument('--out', default=str(RESULTS_PATH), help='where to write the JSON report')
+    args = parser.parse_args(argv)
+    if not args.url:
+        parser.error('no --url given and no api_url configured')
+    if args.rate is not None and args.rate <= 0:
+        parser.error('--rate must be positive (omit it for closed-loop)')
+    results = run_load_test(args.url, args.key, rate=args.rate, concurrency=args.concurrency,
+                            duration=args.duration, steps=args.steps, timeout=args.timeout)
+    path = save_results(results, Path(args.out))
+    print(format_report(results))
+    print(f'Results saved to {path}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
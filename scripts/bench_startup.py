@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark time from launch to the first meaningful tray icon.
+
+Starts a stand-in endpoint that answers slowly, then launches the tray app
+(offscreen) twice in fresh home directories: once cold, with no state
+snapshot, and once warm, with a snapshot from a previous run. Reports how
+long each took from process start to the first green/red icon.
+
+    python scripts/bench_startup.py --delay 2 --runs 3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+_T0 = time.perf_counter()
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _child(timeout: float) -> None:
+    sys.path.insert(0, str(ROOT))
+    from PyQt5 import QtWidgets
+    import app as tray_app
+
+    qapp = QtWidgets.QApplication(sys.argv[:1])
+    qapp.setQuitOnLastWindowClosed(False)
+    tray = tray_app.TrayApp(qapp)
+    init_done = time.perf_counter()
+    deadline = init_done + timeout
+    while tray.first_status_at is None and time.perf_counter() < deadline:
+        qapp.processEvents()
+        time.sleep(0.001)
+    tray.shutdown()
+    first = tray.first_status_at
+    print(json.dumps({
+        'init_ms': (init_done - _T0) * 1000.0,
+        'first_icon_ms': (first - _T0) * 1000.0 if first is not None else None,
+    }))
+
+
+def _serve(delay: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def _launch(home: Path, timeout: float) -> dict:
+    env = dict(os.environ, HOME=str(home), QT_QPA_PLATFORM='offscreen')
+    out = subprocess.run([sys.executable, __file__, '--child', '--timeout', str(timeout)],
+                         env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--delay', type=float, default=2.0, help='seconds the stand-in endpoint takes to answer')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args.timeout)
+        return
+
+    httpd = _serve(args.delay)
+    url = 'http://127.0.0.1:%d/health' % httpd.server_address[1]
+    results = {'cold': [], 'warm': []}
+    try:
+        for _ in range(args.runs):
+            for scenario in ('cold', 'warm'):
+                with tempfile.TemporaryDirectory() as tmp:
+                    home = Path(tmp)
+                    config = {'api_url': url, 'api_key': '', 'interval_seconds': 60, 'notify_mode': 'off'}
+                    (home / '.api_tray_config.json').write_text(json.dumps(config), encoding='utf-8')
+                    if scenario == 'warm':
+                        # A previous run leaves the snapshot behind on quit
+                        _launch(home, args.timeout + args.delay)
+                    results[scenario].append(_launch(home, args.timeout))
+    finally:
+        httpd.shutdown()
+
+    print(f'endpoint delay: {args.delay:.1f}s, runs: {args.runs}')
+    for scenario, runs in results.items():
+        firsts = [r['first_icon_ms'] for r in runs if r['first_icon_ms'] is not None]
+        inits = [r['init_ms'] for r in runs]
+        first = f'{statistics.median(firsts):8.1f} ms' if firsts else '   (none)'
+        print(f'{scenario:>5}: first icon {first}   TrayApp ready {statistics.median(inits):8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
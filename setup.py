@@ -11,6 +11,7 @@ OPTIONS = {
         'PyQt5.QtWidgets',
         'sip',
         'core',
+        'loadtest',
     ],
     'qt_plugins': ['platforms', 'styles', 'imageformats'],  # include key Qt plugin groups
     'iconfile': 'assets/AppIcon.icns',
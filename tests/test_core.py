@@ -2,8 +2,14 @@ import json
 from unittest import mock
 
 import builtins
+import socket
+import threading
+import time
+import timeit
 import types
 
+import pytest
+
 import core
 
 
@@ -54,3 +60,412 @@ def test_check_api_exception(monkeypatch):
     monkeypatch.setattr(core.requests, 'get', raise_exc)
     assert core.check_api('https://example.com/health', '') is False
 
+
+def test_check_api_details_uses_session(monkeypatch):
+    calls = []
+
+    class FakeSession:
+        def get(self, url, headers=None, timeout=None):
+            calls.append((url, headers, timeout))
+
+            class Resp:
+                ok = True
+                status_code = 204
+            return Resp()
+
+    def fail_get(*args, **kwargs):
+        raise AssertionError('module-level requests.get should not be used')
+
+    monkeypatch.setattr(core.requests, 'get', fail_get)
+    ok, status, err = core.check_api_details('https://example.com/health', 'k', session=FakeSession(), timeout=2)
+    assert (ok, status, err) == (True, 204, None)
+    assert calls == [('https://example.com/health', {'Authorization': 'Bearer k'}, 2)]
+
+
+def test_registry_record_tracks_status_and_failures():
+    reg = core.EndpointRegistry()
+    eid = reg.add('https://example.com/health', now=100.0)
+    assert reg.status(eid) == core.STATUS_UNKNOWN
+    assert reg.record(eid, False, 0.25, now=110.0) is True
+    assert reg.record(eid, False, 0.5, now=120.0) is False
+    assert reg.failures(eid) == 2
+    assert reg.last_change(eid) == 110.0
+    assert reg.latency(eid) == 0.5
+    assert reg.record(eid, True, 0.1, now=130.0) is True
+    assert reg.failures(eid) == 0
+    assert reg.status(eid) == core.STATUS_UP
+
+
+def test_registry_reuses_removed_slots():
+    reg = core.EndpointRegistry()
+    a = reg.add('a')
+    b = reg.add('b')
+    reg.record(b, False, 1.0)
+    reg.remove(b)
+    assert b not in reg
+    assert len(reg) == 1
+    assert reg.down_ids() == []
+    with pytest.raises(KeyError):
+        reg.status(b)
+    c = reg.add('c')
+    assert c == b
+    assert reg.status(c) == core.STATUS_UNKNOWN
+    assert reg.failures(c) == 0
+    assert reg.key(c) == 'c'
+    assert reg.ids() == [a, c]
+
+
+def test_registry_due_ids_skip_free_slots():
+    reg = core.EndpointRegistry()
+    a = reg.add(now=0.0)
+    b = reg.add(now=0.0)
+    reg.schedule(a, 50.0)
+    reg.remove(b)
+    assert reg.due_ids(now=10.0) == []
+    assert reg.due_ids(now=50.0) == [a]
+
+
+def test_registry_memory_per_endpoint_within_budget():
+    n = 20000
+    reg = core.EndpointRegistry()
+    for i in range(n):
+        reg.add(now=0.0)
+    # Hot fields take 25 bytes plus an 8-byte key slot; allow for array growth.
+    assert reg.nbytes() / n < 48
+
+
+def test_registry_bulk_down_query_is_fast():
+    n = 20000
+    reg = core.EndpointRegistry()
+    for i in range(n):
+        eid = reg.add(now=0.0)
+        reg.record(eid, i % 1000 != 0, 0.01, now=0.0)
+    assert len(reg.down_ids()) == n // 1000
+    best = min(timeit.repeat(reg.down_ids, number=100, repeat=5)) / 100
+    assert best < 200e-6
+
+
+def test_registry_bulk_down_query_dense_outage():
+    n = 20000
+    reg = core.EndpointRegistry()
+    for i in range(n):
+        eid = reg.add(now=0.0)
+        reg.record(eid, i % 10 == 0, 0.01, now=0.0)
+    reg.remove(5)
+    expected = [i for i in range(n) if i % 10 != 0 and i != 5]
+    assert reg.down_ids() == expected
+    assert reg.up_ids() == list(range(0, n, 10))
+    best = min(timeit.repeat(reg.down_ids, number=20, repeat=5)) / 20
+    assert best < 2e-3
+
+
+def test_registry_find_tracks_key_changes():
+    reg = core.EndpointRegistry()
+    a = reg.add('https://a.example')
+    b = reg.add('https://b.example')
+    assert reg.find('https://a.example') == a
+    reg.set_key(a, 'https://a2.example')
+    assert reg.find('https://a.example') is None
+    assert reg.find('https://a2.example') == a
+    reg.remove(b)
+    assert reg.find('https://b.example') is None
+    c = reg.add('https://c.example')
+    assert c == b and reg.find('https://c.example') == c
+    loaded = core.EndpointRegistry.from_snapshot(reg.to_snapshot())
+    assert loaded.find('https://a2.example') == a
+    assert loaded.find('https://c.example') == c
+    assert loaded.find(None) is None
+
+
+class _StallingServer:
+    """Accepts connections and reads requests but never responds."""
+
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen()
+        self.url = 'http://127.0.0.1:%d/health' % self.sock.getsockname()[1]
+        # Over https the client stalls in the TLS handshake instead
+        self.https_url = self.url.replace('http://', 'https://')
+        self.accepted = threading.Event()
+        self._conns = []
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self._conns.append(conn)
+            self.accepted.set()
+
+    def close(self):
+        for conn in self._conns:
+            conn.close()
+        self.sock.close()
+
+
+@pytest.fixture
+def stalling_server():
+    server = _StallingServer()
+    yield server
+    server.close()
+
+
+def test_check_runner_shutdown_is_bounded(stalling_server):
+    runner = core.CheckRunner(timeout=30)
+    results = []
+    runner.submit(stalling_server.url, '', lambda *r: results.append(r))
+    assert stalling_server.accepted.wait(2)
+    assert runner.busy()
+    started = time.monotonic()
+    assert runner.shutdown(timeout=1.0) is True
+    assert time.monotonic() - started < 0.5
+    assert results == []
+    assert runner.submit(stalling_server.url, '', lambda *r: results.append(r)) is None
+
+
+def test_check_runner_aborts_stalled_tls_handshake(stalling_server):
+    runner = core.CheckRunner(timeout=30)
+    results = []
+    runner.submit(stalling_server.https_url, '', lambda *r: results.append(r))
+    assert stalling_server.accepted.wait(2)
+    # Wait for the TLS wrap, which detaches the raw socket's fd
+    deadline = time.monotonic() + 2
+    while runner._inflight[0].sockets[0][0].fileno() != -1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert runner._inflight[0].sockets[0][0].fileno() == -1
+    started = time.monotonic()
+    assert runner.shutdown(timeout=1.0) is True
+    assert time.monotonic() - started < 0.5
+    assert results == []
+
+
+@pytest.mark.parametrize('attr, proxied', [('url', False), ('https_url', False), ('url', True)])
+def test_tracking_adapter_reports_sockets(stalling_server, attr, proxied):
+    # Cancellation relies on this hook; fail loudly if urllib3 stops calling it
+    sockets = []
+    session = core.requests.Session()
+    session.mount('http://', core._TrackingAdapter(sockets.append))
+    session.mount('https://', core._TrackingAdapter(sockets.append))
+    url, proxies = getattr(stalling_server, attr), None
+    if proxied:
+        url, proxies = 'http://proxied.invalid/health', {'http': url}
+    with pytest.raises(core.requests.RequestException):
+        session.get(url, timeout=0.2, proxies=proxies)
+    session.close()
+    assert len(sockets) == 1
+
+
+@pytest.fixture
+def stalled_connect_url():
+    """A listener whose backlog is full and never drained, so connect() hangs."""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(0)
+    addr = listener.getsockname()
+    fillers = []
+    for _ in range(8):
+        s = socket.socket()
+        s.setblocking(False)
+        try:
+            s.connect(addr)
+        except BlockingIOError:
+            pass
+        fillers.append(s)
+    try:
+        socket.create_connection(addr, timeout=0.3).close()
+        pytest.skip('could not fill the listen backlog on this platform')
+    except OSError:
+        pass
+    yield 'http://%s:%d/health' % addr
+    for s in fillers:
+        s.close()
+    listener.close()
+
+
+def test_check_runner_aborts_stalled_connect(stalled_connect_url):
+    runner = core.CheckRunner(timeout=30)
+    results = []
+    runner.submit(stalled_connect_url, '', lambda *r: results.append(r))
+    deadline = time.monotonic() + 2
+    while not runner._inflight[0].sockets and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert runner._inflight[0].sockets
+    started = time.monotonic()
+    assert runner.shutdown(timeout=1.0) is True
+    assert time.monotonic() - started < 0.5
+    assert results == []
+
+
+def test_check_runner_drops_stale_generation(stalling_server, monkeypatch):
+    runner = core.CheckRunner(timeout=30)
+    results = []
+    first = runner.submit(stalling_server.url, '', lambda *r: results.append(r))
+    assert stalling_server.accepted.wait(2)
+    assert runner.invalidate() == first + 1
+    assert not runner.busy()
+
+    def fake_check(api_url, api_key, session=None, timeout=5):
+        return True, 200, None
+
+    monkeypatch.setattr(core, 'check_api_details', fake_check)
+    done = threading.Event()
+    runner.submit('https://example.com/health', '', lambda *r: (results.append(r), done.set()))
+    assert done.wait(2)
+    assert runner.shutdown(timeout=1.0) is True
+    assert len(results) == 1
+    generation, ok, status, err, _latency = results[0]
+    assert (generation, ok, status, err) == (first + 1, True, 200, None)
+
+
+def test_notifications_batch_into_summary():
+    p = core.NotificationPipeline(window=2.0)
+    for key in range(12):
+        p.push(key, False, now=100.0 + key * 0.1)
+    assert p.flush(now=101.0) == []
+    assert p.due_in(now=101.0) == pytest.approx(1.0)
+    out = p.flush(now=102.0)
+    assert [(n.title, n.message, n.ok) for n in out] == [('APIs Down', '12 endpoints down', False)]
+    assert not p.pending()
+
+
+def test_notifications_single_endpoint_keeps_messages():
+    p = core.NotificationPipeline(window=0.0)
+    p.push('a', False, now=0.0)
+    assert [n.title for n in p.flush(now=0.0)] == ['API Down']
+    p.push('a', True, now=10.0)
+    assert [n.title for n in p.flush(now=10.0)] == ['API Recovered']
+
+
+def test_notifications_respect_mode():
+    p = core.NotificationPipeline(window=0.0)
+    p.push('a', False, now=0.0)
+    p.push('b', True, now=0.0)
+    assert [n.ok for n in p.flush(mode='fail', now=0.0)] == [False]
+    p.push('c', False, now=1.0)
+    assert p.flush(mode='off', now=1.0) == []
+
+
+def test_notifications_bounce_is_not_reported():
+    p = core.NotificationPipeline(window=1.0)
+    # Down and back up inside one window is no net change
+    p.push('b', False, now=5.0)
+    p.push('b', True, now=5.5)
+    assert p.flush(now=6.0) == []
+    assert not p.pending()
+
+
+def test_notifications_cooldown_defers_change():
+    p = core.NotificationPipeline(window=1.0, cooldown=300.0, flap_threshold=10)
+    p.push('a', False, now=0.0)
+    assert [n.title for n in p.flush(now=1.0)] == ['API Down']
+    p.push('a', True, now=10.0)
+    assert [n.title for n in p.flush(now=11.0)] == ['API Recovered']
+    # Down again after a recovery is a real change: held back, not dropped
+    p.push('a', False, now=20.0)
+    assert p.flush(now=21.0) == []
+    assert p.deferred == 1
+    assert p.due_in(now=21.0) == pytest.approx(280.0)
+    assert [n.title for n in p.flush(now=301.0)] == ['API Down']
+    assert not p.pending()
+
+
+def test_notifications_cooldown_drops_change_that_reverts():
+    p = core.NotificationPipeline(window=1.0, cooldown=300.0, flap_threshold=10)
+    for ts, ok in ((0.0, False), (10.0, True)):
+        p.push('a', ok, now=ts)
+        p.flush(now=ts + 1.0)
+    p.push('a', False, now=20.0)
+    assert p.flush(now=21.0) == []
+    # It recovered again before the cooldown ended; "Recovered" is still true
+    p.push('a', True, now=100.0)
+    assert p.flush(now=301.0) == []
+    assert not p.pending()
+
+
+def test_notifications_flapping_endpoint_reports_settled_state():
+    p = core.NotificationPipeline(window=1.0, cooldown=0.0, flap_threshold=4, flap_window=600.0)
+    sent = []
+    for i in range(6):
+        p.push('a', i % 2 == 1, now=i * 10.0)
+        sent.extend(p.flush(now=i * 10.0 + 1.0))
+    # Muted after the fourth transition; the last one (UP at t=50) is pending
+    assert [n.ok for n in sent] == [False, True, False]
+    assert p.deferred == 1
+    # The fourth-last transition (t=20) leaves the flap window at t=620
+    assert p.due_in(now=51.0) == pytest.approx(569.0)
+    assert [n.ok for n in p.flush(now=620.0)] == [True]
+    assert not p.pending()
+
+
+def test_notifications_global_rate_limit_defers():
+    p = core.NotificationPipeline(window=0.0, rate_limit=2, rate_period=60.0, flap_threshold=100)
+    sent = []
+    for i in range(4):
+        p.push(i, False, now=float(i))
+        sent.extend(p.flush(now=float(i)))
+    assert len(sent) == 2
+    assert p.deferred == 2
+    assert p.due_in(now=3.0) == pytest.approx(57.0)
+    out = p.flush(now=60.0)
+    assert [(n.title, n.message) for n in out] == [('APIs Down', '2 endpoints down')]
+    assert not p.pending()
+
+
+def test_notifications_mode_filtered_change_updates_state():
+    p = core.NotificationPipeline(window=0.0, cooldown=0.0, flap_threshold=100)
+    p.push('a', False, now=0.0)
+    p.flush(mode='fail', now=0.0)
+    p.push('a', True, now=1.0)
+    assert p.flush(mode='fail', now=1.0) == []
+    assert not p.pending()
+    p.push('a', False, now=2.0)
+    assert [n.ok for n in p.flush(mode='fail', now=2.0)] == [False]
+
+
+def test_snapshot_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, 'SNAPSHOT_PATH', tmp_path / 'state.json')
+    reg = core.EndpointRegistry()
+    a = reg.add('https://a.example/health', now=1.0)
+    b = reg.add('https://b.example/health', now=1.0)
+    c = reg.add('https://c.example/health', now=1.0)
+    reg.record(a, True, 0.125, now=5.0)
+    reg.record(c, False, 0.5, now=6.0)
+    reg.schedule(c, 66.0)
+    reg.remove(b)
+    core.save_snapshot(reg, {'checks': 3})
+
+    loaded, aggregates, saved_at = core.load_snapshot()
+    assert aggregates == {'checks': 3}
+    assert saved_at > 0
+    assert loaded.ids() == [a, c]
+    assert loaded.find('https://c.example/health') == c
+    assert loaded.find('https://b.example/health') is None
+    assert loaded.status(a) == core.STATUS_UP
+    assert loaded.latency(a) == 0.125
+    assert (loaded.status(c), loaded.failures(c), loaded.next_due(c), loaded.last_change(c)) == \
+        (core.STATUS_DOWN, 1, 66.0, 6.0)
+    # Freed slots are reused after a reload too
+    assert loaded.add('https://d.example/health') == b
+
+
+def test_load_snapshot_missing_or_corrupt(tmp_path, monkeypatch):
+    path = tmp_path / 'state.json'
+    monkeypatch.setattr(core, 'SNAPSHOT_PATH', path)
+    assert core.load_snapshot() is None
+    path.write_text('{"version": 1, "registry": {"status": "!!"}}', encoding='utf-8')
+    assert core.load_snapshot() is None
+    path.write_text(json.dumps({'version': 999}), encoding='utf-8')
+    assert core.load_snapshot() is None
+    for data in ([], 'x', 3):
+        path.write_text(json.dumps(data), encoding='utf-8')
+        assert core.load_snapshot() is None
+    core.save_snapshot(core.EndpointRegistry(), {'checks': 2, 'latency_ewma': None})
+    good = json.loads(path.read_text(encoding='utf-8'))
+    assert core.load_snapshot() is not None
+    for field, value in (('aggregates', []), ('aggregates', {'checks': 'x'}), ('aggregates', {'ok': True}),
+                         ('registry', []), ('saved_at', 'yesterday')):
+        path.write_text(json.dumps(dict(good, **{field: value})), encoding='utf-8')
+        assert core.load_snapshot() is None
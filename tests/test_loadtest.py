@@ -0,0 +1,120 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import loadtest
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        code = 500 if self.path.startswith('/fail') else 200
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    t = threading.Thread(target=httpd.serve_forever, daemon=True)
+    t.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_open_loop_hits_target_rate(server):
+    results = loadtest.run_load_test(server + '/health', rate=50, concurrency=4, duration=1.0)
+    s = results['summary']
+    assert results['mode'] == 'open-loop'
+    assert s['requests'] == 50
+    assert s['failed'] == 0
+    assert s['achieved_rps'] > 40
+    assert sum(b['count'] for b in s['histogram']) == 50
+    assert s['latency_ms']['p50'] <= s['latency_ms']['p99'] <= s['latency_ms']['max']
+    assert results['saturated'] is False
+
+
+def test_closed_loop_errors_are_broken_down(server):
+    results = loadtest.run_load_test(server + '/fail', concurrency=2, duration=0.3)
+    s = results['summary']
+    assert results['mode'] == 'closed-loop'
+    assert s['requests'] > 0
+    assert s['errors'] == {'HTTP 500': s['requests']}
+    assert results['saturated'] is True
+
+
+def test_ramp_reports_saturation_point(monkeypatch):
+    # A single worker that takes 40 ms per request tops out near 25 rps.
+    def slow_check(api_url, api_key, session=None, timeout=5):
+        threading.Event().wait(0.04)
+        return True, 200, None
+
+    monkeypatch.setattr(loadtest, 'check_api_details', slow_check)
+    results = loadtest.run_load_test('http://stand-in', rate=30, concurrency=1, duration=1.5, steps=3)
+    assert [s['target_rps'] for s in results['steps']] == [10, 20, 30]
+    assert results['saturation_rps'] == 30
+    # Open-loop latency includes time spent queued behind the slow worker.
+    assert results['steps'][-1]['latency_ms']['max'] > 80
+
+
+def test_save_results_writes_json(tmp_path, server):
+    results = loadtest.run_load_test(server, rate=10, duration=0.2)
+    path = loadtest.save_results(results, tmp_path / 'out.json')
+    assert json.loads(path.read_text())['summary']['requests'] == results['summary']['requests']
+
+
+def test_requires_url():
+    with pytest.raises(ValueError):
+        loadtest.run_load_test('')
+
+
+def test_stopped_before_start_returns_empty_summary(server):
+    stop = threading.Event()
+    stop.set()
+    results = loadtest.run_load_test(server, rate=10, duration=1.0, steps=2, stop=stop)
+    assert results['steps'] == []
+    assert results['summary']['requests'] == 0
+    assert results['saturated'] is False
+    assert 'requests=0' in loadtest.format_report(results)
+
+
+def test_low_rate_still_sends_one_request(server):
+    results = loadtest.run_load_test(server, rate=0.5, duration=1.0)
+    s = results['summary']
+    assert s['requests'] == 1
+    assert s['achieved_rps'] == pytest.approx(0.5, rel=0.1)
+    assert results['saturated'] is False
+
+
+def test_ramp_summary_percentiles_cover_all_samples(monkeypatch):
+    samples = iter([[1.0] * 10, [100.0] * 10])
+
+    def fake_step(api_url, api_key, rate, duration, pool, executor, timeout, stop):
+        recorder = loadtest._Recorder()
+        for latency in next(samples):
+            recorder.record(latency, True, 200, None)
+        return recorder, duration, rate
+
+    monkeypatch.setattr(loadtest, '_run_open_loop', fake_step)
+    results = loadtest.run_load_test('http://stand-in', rate=20, duration=2.0, steps=2)
+    assert [s['latency_ms']['p50'] for s in results['steps']] == [1.0, 100.0]
+    lat = results['summary']['latency_ms']
+    assert (lat['p50'], lat['p99'], lat['max']) == (1.0, 100.0, 100.0)
+    assert results['summary']['requests'] == 20
+    assert results['summary']['achieved_rps'] == 10.0
+
+
+@pytest.mark.parametrize('rate', ['0', '-5'])
+def test_cli_rejects_non_positive_rate(rate, capsys):
+    with pytest.raises(SystemExit) as exc:
+        loadtest.main(['--url', 'http://stand-in', '--rate', rate])
+    assert exc.value.code == 2
+    assert '--rate must be positive' in capsys.readouterr().err